@@ -29,212 +29,749 @@ Usage:
 
 3. Run the script:
    python script.py
+
+4. Optional settings (in `.env`):
+   - `BATCH_SIZE`: number of permutations to process per run (default 1). Browsers are launched
+     once per run and reused for every permutation in the batch.
+   - `CONCURRENCY`: number of permutations processed at the same time within each worker process
+     (default 4). Each of these slots runs its own Chromium, so this is also the number of browser
+     processes per worker (capped at the batch size).
+   - `WORKERS`: number of processes the batch is split across (default 1).
+
+   Each concurrent slot runs its own browser with a profile under `.pw_profile/`, so cached site
+   assets are reused on later runs. Only the HTTP cache is kept: cookies and all other site data are
+   wiped between permutations. Slots (and overlapping runs) each lease a profile nobody else is
+   using, so runs may safely overlap.
 """
 
-import json
-import os
-import imaplib
 import email
-from email.header import decode_header
+import hashlib
+import mmap
+import os
+import quopri
 import re
-from playwright.sync_api import sync_playwright
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from datetime import date, timedelta
+from itertools import islice
+from pathlib import Path
 from dotenv import load_dotenv
-import smtplib
-from email.mime.text import MIMEText
 
 load_dotenv()
 
-# File to store email permutations and tracking
+# Playwright, imapclient, smtplib, asyncio and other modules only needed once a
+# batch is running are imported where they are used, so runs that exit early
+# (e.g. no permutations left) don't pay for loading them
+
+# Legacy JSON state file, read once to carry the index over to the binary state file
 PERMUTATIONS_FILE = "email_permutations.json"
+# Permutation orders recorded in the state file. Progress migrated from the JSON
+# file keeps the binary order it was made in, so no used email is revisited
+ORDER_GRAY = 0
+ORDER_BINARY = 1
 # File to log used email permutations dynamically
 USED_EMAILS_FILE = "used_emails.txt"
-
-def send_sms_via_email(phone_number, carrier_gateway, message, gmail_username, gmail_app_password):
+# Longest username whose permutations are precomputed to disk (2^19 records)
+MAX_TABLE_USERNAME = 20
+# How long to wait for the site to settle after submitting a form
+PAGE_TIMEOUT_MS = 15000
+# Resource types the forms don't need; blocked to cut page-load time
+BLOCKED_RESOURCE_TYPES = {"image", "font", "stylesheet", "media"}
+# Chromium profiles, kept between runs so the browser's HTTP cache is reused
+PROFILE_DIR = ".pw_profile"
+# Backoff between checks for the verification email, in seconds
+POLL_DELAYS = (1, 2, 4, 8, 16)
+# Length of each IMAP IDLE round on the watcher connection, in seconds
+IDLE_SLICE = 5
+# Matches the "Verify Email ( https://... )" link in the raw message text
+VERIFY_RE = re.compile(rb"Verify Email\s*\(\s*(https://\S+)\s*\)")
+
+@dataclass
+class Settings:
+    """Runtime configuration read from the environment (.env)."""
+    gmail_username: str
+    gmail_app_password: str
+    base_email: str
+    first_name: str
+    last_name: str
+    phone_number: str
+    carrier_gateway: str
+    batch_size: int
+    concurrency: int
+    workers: int
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            # Gmail credentials
+            gmail_username=os.getenv("GMAIL_EMAIL"),
+            gmail_app_password=os.getenv("GMAIL_APP_PASSWORD"),  # App password
+            # Base email input
+            base_email=os.getenv("GMAIL_EMAIL"),
+            first_name=os.getenv("FIRST_NAME"),  # First name for verification form
+            last_name=os.getenv("LAST_NAME"),  # Last name for verification form
+            # Phone number and carrier gateway
+            phone_number=os.getenv("PHONE_NUMBER"),  # e.g., "1234567890"
+            carrier_gateway=os.getenv("CARRIER_GATEWAY"),  # e.g., "vtext.com" for Verizon
+            # Number of permutations to process per run, how many run at once in
+            # each process, and how many worker processes to split them across
+            batch_size=int(os.getenv("BATCH_SIZE", "1")),
+            concurrency=int(os.getenv("CONCURRENCY", "4")),
+            workers=int(os.getenv("WORKERS", "1")),
+        )
+
+class SmtpSession:
+    """A single authenticated SMTP connection reused for every SMS in a run.
+
+    Opened lazily on the first send; safe to share across threads.
+    """
+
+    def __init__(self, gmail_username, gmail_app_password, host="smtp.gmail.com", port=587):
+        self.gmail_username = gmail_username
+        self.gmail_app_password = gmail_app_password
+        self.host = host
+        self.port = port
+        self._server = None
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._server is None:
+            import smtplib
+            server = smtplib.SMTP(self.host, self.port)
+            server.starttls()
+            server.login(self.gmail_username, self.gmail_app_password)
+            self._server = server
+        return self._server
+
+    def _invalidate(self):
+        server, self._server = self._server, None
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                pass
+
+    def close(self):
+        with self._lock:
+            self._invalidate()
+
+    def sendmail(self, to_addr, msg):
+        import smtplib
+        with self._lock:
+            try:
+                self._connect().sendmail(self.gmail_username, to_addr, msg)
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                # The server dropped an idle connection; reconnect once and retry
+                self._invalidate()
+                self._connect().sendmail(self.gmail_username, to_addr, msg)
+
+def send_sms_via_email(smtp, phone_number, carrier_gateway, message):
     """Sends an SMS to the phone number via the carrier's email-to-SMS gateway."""
+    from email.mime.text import MIMEText
+
     sms_email = f"{phone_number}@{carrier_gateway}"
     try:
         # Set up the email message
         msg = MIMEText(message)
-        msg["From"] = gmail_username
+        msg["From"] = smtp.gmail_username
         msg["To"] = sms_email
         msg["Subject"] = "Taco Bell Automation Notification"
 
-        # Connect to Gmail's SMTP server
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(gmail_username, gmail_app_password)
-            server.sendmail(gmail_username, sms_email, msg.as_string())
+        smtp.sendmail(sms_email, msg.as_string())
 
         print(f"SMS sent to {phone_number} via {carrier_gateway}.")
     except Exception as e:
         print(f"Failed to send SMS: {e}")
 
-# Load or initialize the email tracking file
-def load_permutations(email):
-    if not os.path.exists(PERMUTATIONS_FILE):
-        return {"base_email": email, "current_index": 0}
-    with open(PERMUTATIONS_FILE, "r") as f:
-        data = json.load(f)
-        if data.get("base_email") != email:
-            # Reset if the base email changes
-            return {"base_email": email, "current_index": 0}
-        return data
-
-# Save the updated state
-def save_permutations(data):
-    with open(PERMUTATIONS_FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-# Append the generated email to a text file
-def log_email_to_file(generated_email):
-    with open(USED_EMAILS_FILE, "a") as f:
-        f.write(generated_email + "\n")
+# Short stable key used to name per-base-email files
+def email_key(email):
+    return hashlib.sha1(email.encode()).hexdigest()[:12]
+
+# Per-base-email state file: the next permutation index (8 bytes, little-endian)
+# followed by a one-byte permutation order
+def state_file(email):
+    return Path(f".perm_{email_key(email)}")
+
+# Load (next permutation index, order), or (0, ORDER_GRAY) for a new base email
+def load_state(email):
+    try:
+        data = state_file(email).read_bytes()
+        return int.from_bytes(data[:8], "little"), data[8] if len(data) > 8 else ORDER_GRAY
+    except FileNotFoundError:
+        pass
+    # Carry over progress from the old JSON state file, if it tracked this email.
+    # Its index counts permutations in binary order, so keep using that order
+    if os.path.exists(PERMUTATIONS_FILE):
+        import json
+        with open(PERMUTATIONS_FILE, "r") as f:
+            data = json.load(f)
+        if data.get("base_email") == email:
+            return data["current_index"], ORDER_BINARY
+    return 0, ORDER_GRAY
+
+# Save the next permutation index and order (atomically, via a temp file)
+def save_state(email, index, order):
+    path = state_file(email)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(index.to_bytes(8, "little") + bytes([order]))
+    os.replace(tmp, path)
+
+# Open the used-emails log once per batch; lines are buffered and written out when it closes
+def open_email_log():
+    return open(USED_EMAILS_FILE, "ab", buffering=64 * 1024)
+
+# Append the generated email to the log
+def log_email_to_file(log_file, generated_email):
+    log_file.write(generated_email.encode() + b"\n")
 
 # Efficiently generate the nth permutation
-def generate_nth_permutation(base_email, n):
+# Permutations are ordered as a Gray code by default: bit i of the mask puts a dot
+# after character i, and consecutive permutations differ by exactly one dot
+def generate_nth_permutation(base_email, n, order=ORDER_GRAY):
     username, domain = base_email.split("@")
-    parts = list(username)
-    length = len(parts)
-    total_permutations = 1 << (length - 1)  # 2^(length-1)
+    total_permutations = 1 << (len(username) - 1)  # 2^(length-1)
 
     if n >= total_permutations:
         return None
 
-    result = []
-    for i in range(length):
-        result.append(parts[i])
-        if n & (1 << i):  # Add a dot if the bit is set
-            result.append(".")
-    return f"{''.join(result)}@{domain}"
+    mask = n ^ (n >> 1) if order == ORDER_GRAY else n  # nth Gray code, or n itself
+    # Bit i puts a dot after character i: cut the username at each set bit,
+    # lowest first, and join the pieces with dots
+    pieces = []
+    start = 0
+    while mask:
+        low = mask & -mask
+        end = low.bit_length()
+        pieces.append(username[start:end])
+        start = end
+        mask ^= low
+    pieces.append(username[start:])
+    return f"{'.'.join(pieces)}@{domain}"
+
+# Yield permutations from start_index onwards, flipping one dot per step
+def iter_permutations(base_email, start_index):
+    first = generate_nth_permutation(base_email, start_index)
+    if first is None:
+        return
+    yield first
+
+    username, domain = first.split("@")
+    buf = bytearray(username.encode())
+    suffix = f"@{domain}"
+    total_permutations = 1 << (len(base_email.split("@")[0]) - 1)
+    mask = start_index ^ (start_index >> 1)
+    for n in range(start_index + 1, total_permutations):
+        # Going from Gray code n-1 to n flips the lowest set bit of n
+        i = (n & -n).bit_length() - 1
+        # Offset just after character i, counting the dots already before it
+        pos = i + 1 + bin(mask & ((1 << i) - 1)).count("1")
+        if mask & (1 << i):
+            del buf[pos]
+        else:
+            buf[pos:pos] = b"."
+        mask ^= 1 << i
+        yield buf.decode() + suffix
+
+class PermutationTable:
+    """Every permutation of a base email, precomputed once into a file and read through mmap.
+
+    Records are fixed-width UTF-8, padded with NUL bytes, so the nth permutation
+    is a single slice at n * width.
+    """
+
+    def __init__(self, base_email):
+        username, domain = base_email.split("@")
+        # Room for a dot between every pair of characters, plus "@domain"
+        self.width = len(username.encode()) * 2 + len(domain.encode())
+        self.count = 1 << (len(username) - 1)
+        self.path = Path(f"perms_{email_key(base_email)}.bin")
+
+        if not self.path.exists() or self.path.stat().st_size != self.count * self.width:
+            self._build(base_email)
+        with open(self.path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _build(self, base_email):
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "wb") as f:
+            for permutation in iter_permutations(base_email, 0):
+                f.write(permutation.encode().ljust(self.width, b"\0"))
+        os.replace(tmp, self.path)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, n):
+        if not 0 <= n < self.count:
+            raise IndexError(n)
+        return self._mm[n * self.width:(n + 1) * self.width].rstrip(b"\0").decode()
+
+    def close(self):
+        self._mm.close()
+
+# Reserve up to count permutations starting at start_index
+def reserve_permutations(base_email, start_index, count, order=ORDER_GRAY):
+    if order == ORDER_BINARY:
+        # Legacy progress: the table and iterator are Gray-ordered, build each one directly
+        emails = (generate_nth_permutation(base_email, n, ORDER_BINARY)
+                  for n in range(start_index, start_index + count))
+        return [e for e in emails if e is not None]
+
+    if len(base_email.split("@")[0]) > MAX_TABLE_USERNAME:
+        # Too many permutations to precompute, walk them instead
+        return list(islice(iter_permutations(base_email, start_index), count))
+
+    table = PermutationTable(base_email)
+    try:
+        return [table[n] for n in range(start_index, min(start_index + count, len(table)))]
+    finally:
+        table.close()
+
+# Abort requests for resources the forms don't need
+async def block_heavy_resources(route):
+    if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+        await route.abort()
+    else:
+        await route.continue_()
+
+# Launch a browser with an on-disk profile, so the site's JS and other cached
+# assets survive across runs. Images, fonts and CSS are skipped entirely
+async def launch_context(playwright, user_data_dir):
+    context = await playwright.chromium.launch_persistent_context(
+        user_data_dir=user_data_dir,
+        headless=True,
+        args=["--disable-dev-shm-usage", "--no-sandbox"],
+    )
+    try:
+        await context.route("**/*", block_heavy_resources)
+    except Exception:
+        # Don't leave a browser running (and holding the profile) if setup fails
+        await context.close()
+        raise
+    return context
+
+# scheme://host[:port] of an http(s) URL, or None for anything else
+def url_origin(url):
+    from urllib.parse import urlsplit
+
+    parts = urlsplit(url)
+    if parts.scheme in ("http", "https"):
+        return f"{parts.scheme}://{parts.netloc}"
+    return None
+
+# Open a page for one permutation in a shared persistent context. Afterwards, all
+# site data (cookies, localStorage, IndexedDB, Cache Storage, service workers, ...)
+# is wiped for every origin the page requested, so nothing carries over to the next
+# permutation. The HTTP cache is not site data and is kept
+@asynccontextmanager
+async def isolated_page(context):
+    await context.clear_cookies()
+    page = await context.new_page()
+    origins = set()
+    page.on("request", lambda request: origins.add(url_origin(request.url)))
+    try:
+        yield page
+    finally:
+        try:
+            cdp = await context.new_cdp_session(page)
+            for origin in origins - {None}:
+                await cdp.send("Storage.clearDataForOrigin", {"origin": origin, "storageTypes": "all"})
+            await cdp.detach()
+        except Exception as e:
+            print(f"Error clearing site data: {e}")
+        await page.close()
 
-# Step 1: Create Taco Bell Account
-def create_taco_bell_account(email):
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=False)  # Set to True for headless mode
-        context = browser.new_context()  # Create a new incognito-like context
-        page = context.new_page()
+# Take an exclusive lock on an open file: flock on POSIX, msvcrt on Windows.
+# Returns False instead of waiting if blocking is off and the lock is held elsewhere
+def lock_file(f, blocking=True):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        while True:
+            try:
+                # LK_LOCK itself only retries for ~10s, so keep trying
+                msvcrt.locking(f.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                return True
+            except OSError:
+                if not blocking:
+                    return False
 
-        page.goto("https://www.tacobell.com/register/yum")
-        page.fill('[name="email"]', email)
-        page.click('button:has-text("Confirm")')
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except BlockingIOError:
+        return False
 
+def unlock_file(f):
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        fcntl.flock(f, fcntl.LOCK_UN)
+
+# Lease the first browser profile not already in use by another slot or run.
+# Returns the profile directory and its open lock file; pass the latter to release_profile
+def acquire_profile():
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    n = 0
+    while True:
+        lock = open(os.path.join(PROFILE_DIR, f"{n}.lock"), "w")
+        if lock_file(lock, blocking=False):
+            return os.path.join(PROFILE_DIR, str(n)), lock
+        lock.close()
+        n += 1
+
+def release_profile(lock):
+    unlock_file(lock)
+    lock.close()
+
+# Atomically claim the next count permutations, so concurrent runs never overlap
+def claim_permutations(base_email, count):
+    # Lock a separate file: the state file itself is swapped out by os.replace
+    lock_path = state_file(base_email).with_suffix(".lock")
+    with open(lock_path, "w") as lock:
+        lock_file(lock)
         try:
-            page.wait_for_timeout(5000)
-            print(f"Account creation attempted for {email}.")
-        except Exception as e:
-            print(f"Error during account creation: {e}")
+            current_index, order = load_state(base_email)
+            emails = reserve_permutations(base_email, current_index, count, order)
+            if emails:
+                # Advance the index up front so a crashed run never reuses these permutations
+                save_state(base_email, current_index + len(emails), order)
+            return emails
+        finally:
+            unlock_file(lock)
+
+# Click a form's submit button and wait for the POST that click sends to get a response.
+# The wait is armed before the click, so it can't return early on an already-idle page
+async def submit_form(page, button):
+    async with page.expect_response(lambda r: r.request.method == "POST", timeout=PAGE_TIMEOUT_MS) as response_info:
+        await button.click()
+    response = await response_info.value
+    # Then let any navigation or follow-up requests the submit started settle
+    await page.wait_for_load_state("networkidle", timeout=PAGE_TIMEOUT_MS)
+    return response
 
-        browser.close()
+# Step 1: Create Taco Bell Account
+async def create_taco_bell_account(page, email):
+    await page.goto("https://www.tacobell.com/register/yum")
+    email_input = page.locator('[name="email"]')
+    confirm_button = page.locator('button:has-text("Confirm")')
+
+    await email_input.fill(email)
 
-# Step 2: Fetch Email Verification Link
-def fetch_verification_link(gmail_username, gmail_app_password, taco_email):
     try:
-        imap = imaplib.IMAP4_SSL("imap.gmail.com")
-        imap.login(gmail_username, gmail_app_password)
-        imap.select("inbox")
+        # Wait for the signup request to finish rather than sleeping a fixed amount
+        response = await submit_form(page, confirm_button)
+        print(f"Account creation attempted for {email} (HTTP {response.status}).")
+    except Exception as e:
+        print(f"Error during account creation: {e}")
 
-        search_criteria = f'TO "{taco_email}"'
-        status, messages = imap.search(None, search_criteria)
-        email_ids = messages[0].split()
+# Step 2: Fetch Email Verification Link
+class ImapSession:
+    """IMAP connections kept open for the whole run.
+
+    One connection, opened lazily and left on INBOX, runs searches and fetches;
+    callers may share it across threads, and each command is serialised with a
+    lock. When the server supports IDLE, a second connection sits in IDLE on a
+    background thread and wakes every waiter as soon as new mail arrives.
+    """
+
+    def __init__(self, gmail_username, gmail_app_password, host="imap.gmail.com"):
+        self.gmail_username = gmail_username
+        self.gmail_app_password = gmail_app_password
+        self.host = host
+        self._client = None
+        self._lock = threading.Lock()
+        # Bumped by the IDLE watcher on new mail; waiters re-search when it changes
+        self._mail_arrived = threading.Condition()
+        self._generation = 0
+        self._watcher = None
+        self._watch_client = None
+        self._closed = threading.Event()
+
+    def _open_client(self):
+        from imapclient import IMAPClient
+        client = IMAPClient(self.host, ssl=True)
+        client.login(self.gmail_username, self.gmail_app_password)
+        client.select_folder("INBOX")
+        return client
+
+    def _connect(self):
+        if self._client is None:
+            self._client = self._open_client()
+            # Start the IDLE watcher alongside the first connection, if the server has IDLE
+            if self._watcher is None and self._client.has_capability("IDLE"):
+                self._watcher = threading.Thread(target=self._watch, daemon=True)
+                self._watcher.start()
+        return self._client
+
+    def _watch(self):
+        # Runs on the watcher thread with its own connection, so IDLE never holds
+        # up searches. close() shuts the socket down to end the current round early
+        client = None
+        while not self._closed.is_set():
+            try:
+                if client is None:
+                    client = self._watch_client = self._open_client()
+                client.idle()
+                responses = client.idle_check(timeout=IDLE_SLICE)
+                responses += client.idle_done()[1]
+                if responses:
+                    with self._mail_arrived:
+                        self._generation += 1
+                        self._mail_arrived.notify_all()
+            except Exception:
+                # Dropped connection: waiters fall back to their backoff until we reconnect
+                if client is not None:
+                    try:
+                        client.logout()
+                    except Exception:
+                        pass
+                client = None
+                self._closed.wait(IDLE_SLICE)
+
+        if client is not None:
+            try:
+                client.logout()
+            except Exception:
+                pass
+
+    def _invalidate(self):
+        # Drop a dead connection (abort/BYE) so the next call reconnects
+        client, self._client = self._client, None
+        if client is not None:
+            try:
+                client.logout()
+            except Exception:
+                pass
+
+    def close(self):
+        # Don't wait for the watcher: shutting its socket down breaks it out of
+        # IDLE right away, and it is a daemon thread in any case
+        self._closed.set()
+        watch_client = self._watch_client
+        if watch_client is not None:
+            import socket
+            try:
+                watch_client.socket().shutdown(socket.SHUT_RDWR)
+            except Exception:
+                pass
+        with self._lock:
+            self._invalidate()
+
+    def _fetch_verification_link(self, client, taco_email):
+        # Only recent unread mail from Taco Bell to this exact permutation
+        criteria = ["UNSEEN", "FROM", "tacobell.com", "TO", taco_email]
+        if client.has_capability("X-GM-EXT-1"):
+            # Gmail: let its search index narrow to the last hour
+            criteria += ["X-GM-RAW", "newer_than:1h"]
+        else:
+            # SINCE only has day granularity and uses the server's timezone, so allow a day
+            criteria += ["SINCE", date.today() - timedelta(days=1)]
+        email_ids = client.search(criteria)
         if not email_ids:
-            print(f"No emails found for {taco_email}.")
             return None
 
+        # Fetch just the message text; PEEK leaves it unread so a re-run still finds it
         latest_email_id = email_ids[-1]
-        status, msg_data = imap.fetch(latest_email_id, "(RFC822)")
-        for response_part in msg_data:
-            if isinstance(response_part, tuple):
-                msg = email.message_from_bytes(response_part[1])
-                body = None
-                if msg.is_multipart():
-                    for part in msg.walk():
-                        if part.get_content_type() == "text/plain":
-                            body = part.get_payload(decode=True).decode()
-                            break
-                else:
-                    body = msg.get_payload(decode=True).decode()
-
-                if body:
-                    match = re.search(r"Verify Email\s*\(\s*(https://[^\s]+)\s*\)", body)
-                    if match:
-                        return match.group(1)
-
-        print("No 'Verify Email' link found.")
+        msg_data = client.fetch([latest_email_id], ["BODY.PEEK[TEXT]"])
+        raw_body = msg_data[latest_email_id][b"BODY[TEXT]"]
+
+        # The raw text is usually quoted-printable, which can wrap the link across lines
+        match = VERIFY_RE.search(quopri.decodestring(raw_body))
+        if match:
+            return match.group(1).decode()
+
+        # Fast path missed (e.g. a base64-encoded text part): fetch the whole message
+        # and decode each text part with its declared transfer encoding
+        msg_data = client.fetch([latest_email_id], ["BODY.PEEK[]"])
+        msg = email.message_from_bytes(msg_data[latest_email_id][b"BODY[]"])
+        for part in msg.walk():
+            if part.get_content_maintype() == "text":
+                match = VERIFY_RE.search(part.get_payload(decode=True) or b"")
+                if match:
+                    return match.group(1).decode()
         return None
 
-    except Exception as e:
-        print(f"Error fetching email: {e}")
+    def wait_for_mail_to(self, taco_email):
+        """Poll for the verification link for taco_email with exponential backoff.
+
+        Each wait ends early when the IDLE watcher reports new mail, so the link is
+        usually picked up as soon as it lands. The shared connection is only held
+        for the search itself, never while waiting.
+        """
+        from imapclient.exceptions import IMAPClientAbortError
+
+        reconnected = False
+        # The trailing 0 makes one last check after the longest wait
+        for delay in POLL_DELAYS + (0,):
+            # Note the generation before searching, so mail landing mid-search still wakes us
+            with self._mail_arrived:
+                seen = self._generation
+
+            with self._lock:
+                try:
+                    client = self._connect()
+                    link = self._fetch_verification_link(client, taco_email)
+                    if link:
+                        return link
+
+                except (IMAPClientAbortError, OSError) as e:
+                    self._invalidate()
+                    if reconnected:
+                        print(f"Error fetching email: {e}")
+                        return None
+                    reconnected = True
+
+                except Exception as e:
+                    print(f"Error fetching email: {e}")
+                    return None
+
+            if delay:
+                with self._mail_arrived:
+                    self._mail_arrived.wait_for(lambda: self._generation != seen, timeout=delay)
+
+        print(f"No 'Verify Email' link found for {taco_email}.")
         return None
 
 # Step 3: Complete Verification Form
-def complete_verification_form(verification_link, first_name, last_name):
+async def complete_verification_form(page, verification_link, first_name, last_name):
     try:
-        with sync_playwright() as p:
-            browser = p.chromium.launch(headless=False)
-            context = browser.new_context()  # Create a new incognito-like context
-            page = context.new_page()
-
-            page.goto(verification_link)
-            page.fill('[name="first_name"]', first_name)
-            page.fill('[name="last_name"]', last_name)
-            page.check('[id="agreement"]')
-            page.click('button:has-text("Confirm")')
-
-            page.wait_for_timeout(5000)
+        await page.goto(verification_link)
+        first_name_input = page.locator('[name="first_name"]')
+        last_name_input = page.locator('[name="last_name"]')
+        agreement_checkbox = page.locator('[id="agreement"]')
+        confirm_button = page.locator('button:has-text("Confirm")')
+
+        await first_name_input.fill(first_name)
+        await last_name_input.fill(last_name)
+        await agreement_checkbox.check()
+
+        response = await submit_form(page, confirm_button)
+        if response.ok:
             print("Verification form completed successfully.")
-            browser.close()
+        else:
+            print(f"Verification form was rejected (HTTP {response.status}).")
 
     except Exception as e:
         print(f"Error completing verification form: {e}")
 
-# Main Function
-def main():
-    # Gmail credentials
-    gmail_username = os.getenv("GMAIL_EMAIL")
-    gmail_app_password = os.getenv("GMAIL_APP_PASSWORD")  # App password
+# Run the full signup pipeline for a single permutation
+async def process_permutation(context, imap, smtp, log_file, email, settings):
+    import asyncio
+
+    print(f"Next permutation: {email}")
 
-    # Base email input
-    base_email = os.getenv("GMAIL_EMAIL")
-    first_name = os.getenv("FIRST_NAME")  # First name for verification form
-    last_name = os.getenv("LAST_NAME")  # Last name for verification form
+    # Log the current permutation to the text file
+    log_email_to_file(log_file, email)
 
-    # Phone number and carrier gateway
-    phone_number = os.getenv("PHONE_NUMBER")  # e.g., "1234567890"
-    carrier_gateway = os.getenv("CARRIER_GATEWAY")  # e.g., "vtext.com" for Verizon
+    # Both browser steps share one page; it is only reset between permutations
+    async with isolated_page(context) as page:
+        # Step 1: Create Taco Bell account
+        await create_taco_bell_account(page, email)
 
-    # Load or initialize permutations
-    data = load_permutations(base_email)
+        # Step 2: Wait for the verification link (IMAP is blocking, so run it off the event loop)
+        verification_link = await asyncio.to_thread(imap.wait_for_mail_to, email)
+        if verification_link:
+            # Step 3: Complete verification
+            await complete_verification_form(page, verification_link, settings.first_name, settings.last_name)
 
-    # Generate the next email permutation
-    next_permutation = generate_nth_permutation(data["base_email"], data["current_index"])
-    if not next_permutation:
-        print("No more permutations available.")
-        return
+    if verification_link:
+        # Send an SMS notification
+        message = f"New Taco Bell account created successfully: {email}"
+        await asyncio.to_thread(
+            send_sms_via_email, smtp, settings.phone_number, settings.carrier_gateway, message
+        )
 
-    print(f"Next permutation: {next_permutation}")
+    else:
+        print(f"Failed to retrieve a verification link for {email}.")
 
-    # Log the current permutation to the text file
-    log_email_to_file(next_permutation)
+# Process a batch of permutations, up to settings.concurrency at a time
+async def run_batch(emails, settings):
+    import asyncio
+    import tempfile
+    from playwright.async_api import async_playwright
 
-    # Step 1: Create Taco Bell account
-    create_taco_bell_account(next_permutation)
+    imap = ImapSession(settings.gmail_username, settings.gmail_app_password)
+    smtp = SmtpSession(settings.gmail_username, settings.gmail_app_password)
+    log_file = open_email_log()
+    try:
+        async with async_playwright() as p:
+            # Each slot pulls the next email from the shared iterator, so a slow
+            # signup never holds up the rest of the batch
+            pending = iter(emails)
+
+            async def run_slot(context):
+                try:
+                    for email in pending:
+                        try:
+                            await process_permutation(context, imap, smtp, log_file, email, settings)
+                        except Exception as e:
+                            print(f"Error processing {email}: {e}")
+                finally:
+                    await context.close()
+
+            async def slot():
+                # One long-lived browser per slot, on a profile no other browser is using
+                # (Chromium locks a profile to a single running browser)
+                profile_dir, profile_lock = acquire_profile()
+                try:
+                    try:
+                        context = await launch_context(p, profile_dir)
+                    except Exception as e:
+                        # Don't give up this slot's share of the batch; use a throwaway profile
+                        print(f"Could not open browser profile {profile_dir} ({e}); using a temporary one.")
+                        with tempfile.TemporaryDirectory(prefix="pw_profile_") as tmp_dir:
+                            await run_slot(await launch_context(p, tmp_dir))
+                        return
+                    await run_slot(context)
+                finally:
+                    release_profile(profile_lock)
+
+            slots = max(1, min(settings.concurrency, len(emails)))
+            results = await asyncio.gather(*(slot() for _ in range(slots)), return_exceptions=True)
+            for result in results:
+                if isinstance(result, Exception):
+                    print(f"Browser slot failed: {result}")
+
+            # Permutations are claimed before the browsers start; report any that no slot reached
+            for email in pending:
+                print(f"Not attempted (no browser available): {email}")
+    finally:
+        imap.close()
+        smtp.close()
+        log_file.close()
+
+# Entry point for worker processes; each runs its own event loop and browsers
+def run_batch_in_process(emails, settings):
+    import asyncio
+    asyncio.run(run_batch(emails, settings))
 
-    # Step 2: Fetch the verification link
-    verification_link = fetch_verification_link(gmail_username, gmail_app_password, next_permutation)
-    if verification_link:
-        # Step 3: Complete verification
-        complete_verification_form(verification_link, first_name, last_name)
+# Main Function
+def main():
+    settings = Settings.from_env()
 
-        # Send an SMS notification
-        message = f"New Taco Bell account created successfully: {next_permutation}"
-        send_sms_via_email(phone_number, carrier_gateway, message, gmail_username, gmail_app_password)
+    # Reserve the next batch of permutations
+    emails = claim_permutations(settings.base_email, settings.batch_size)
+    if not emails:
+        print("No more permutations available.")
+        return
 
+    # Deal the batch out to the worker processes
+    workers = max(1, min(settings.workers, len(emails)))
+    if workers == 1:
+        run_batch_in_process(emails, settings)
     else:
-        print(f"Failed to retrieve a verification link for {next_permutation}.")
-
-    # Increment the index and save the updated state
-    data["current_index"] += 1
-    save_permutations(data)
+        import multiprocessing
+        chunks = [(emails[w::workers], settings) for w in range(workers)]
+        with multiprocessing.Pool(workers) as pool:
+            pool.starmap(run_batch_in_process, chunks)
 
     print("Script completed successfully.")
 